@@ -1,8 +1,17 @@
+import time
+from collections import deque
+
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- CONFIGURATION ---
 BACKEND_URL = "http://127.0.0.1:8000"
+REQUEST_TIMEOUT = (5, 120)  # (connect, read) seconds
+INGEST_POLL_INTERVAL = 1  # seconds
+INGEST_TIMEOUT = 600
+MAX_MESSAGES = 50
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -12,19 +21,52 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --- HTTP SESSION ---
+# One pooled, keep-alive session shared across reruns and users. Auth headers are
+# passed per request because the session is shared between browser sessions.
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=Retry(
+            total=2,
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods={"GET", "POST"},
+            raise_on_status=False
+        )
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+SESSION = get_session()
+
 # --- SESSION STATE ---
 defaults = {
     "token": None,
     "session_id": None,
-    "messages": [],
+    "messages": deque(maxlen=MAX_MESSAGES),
     "file_name": None,
     "user_email": None
 }
 for key, value in defaults.items():
-    if key not in st.session_state:
-        st.session_state[key] = value
+    st.session_state.setdefault(key, value)
 
 # --- AUTHENTICATION LOGIC ---
+def logout():
+    for key in defaults:
+        st.session_state[key] = defaults[key]
+    st.rerun()
+
+def check_auth(response):
+    # An expired or revoked token sends the user back to the login screen.
+    if response.status_code == 401:
+        logout()
+
 def show_login_signup():
     st.header("Welcome to VeriDoc.ai")
     st.markdown("Your AI-powered assistant for deep-diving into crypto whitepapers. Login or create an account to get started.")
@@ -39,9 +81,10 @@ def show_login_signup():
             submitted = st.form_submit_button("Login")
             if submitted:
                 try:
-                    response = requests.post(
+                    response = SESSION.post(
                         f"{BACKEND_URL}/auth/login",
-                        data={"username": email, "password": password}
+                        data={"username": email, "password": password},
+                        timeout=REQUEST_TIMEOUT
                     )
                     if response.status_code == 200:
                         st.session_state.token = response.json().get("access_token")
@@ -60,9 +103,10 @@ def show_login_signup():
             submitted = st.form_submit_button("Sign Up")
             if submitted:
                 try:
-                    response = requests.post(
+                    response = SESSION.post(
                         f"{BACKEND_URL}/auth/signup",
-                        json={"email": email, "password": password}
+                        json={"email": email, "password": password},
+                        timeout=REQUEST_TIMEOUT
                     )
                     if response.status_code == 200:
                         st.session_state.token = response.json().get("access_token")
@@ -75,42 +119,58 @@ def show_login_signup():
                     st.error(f"Connection Error: {e}")
 
 # --- MAIN APP LOGIC ---
-def show_main_app():
-    with st.sidebar:
-        st.title("VeriDoc.ai")
-        st.markdown(f"Welcome, **{st.session_state.user_email}**")
-        st.markdown("---")
-        uploaded_file = st.file_uploader("Upload a PDF Whitepaper", type="pdf")
-        if st.button("Analyze Document"):
-            if uploaded_file is not None:
-                with st.spinner('Processing document...'):
-                    try:
-                        files = {'file': (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                        headers = {"Authorization": f"Bearer {st.session_state.token}"}
-                        response = requests.post(
-                            f"{BACKEND_URL}/upload-whitepaper/", files=files, headers=headers
+# Runs as a fragment so picking a file or clicking around the sidebar only
+# reruns the sidebar, not the whole chat history.
+@st.fragment
+def show_sidebar():
+    st.title("VeriDoc.ai")
+    st.markdown(f"Welcome, **{st.session_state.user_email}**")
+    st.markdown("---")
+    uploaded_file = st.file_uploader("Upload a PDF Whitepaper", type="pdf")
+    if st.button("Analyze Document"):
+        if uploaded_file is not None:
+            with st.spinner('Processing document...'):
+                try:
+                    files = {'file': (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
+                    headers = {"Authorization": f"Bearer {st.session_state.token}"}
+                    response = SESSION.post(
+                        f"{BACKEND_URL}/upload-whitepaper/", files=files, headers=headers,
+                        timeout=REQUEST_TIMEOUT
+                    )
+                    check_auth(response)
+                    ingest = response.json() if response.ok else {}
+                    deadline = time.monotonic() + INGEST_TIMEOUT
+                    while response.ok and ingest.get("status") == "processing" and time.monotonic() < deadline:
+                        time.sleep(INGEST_POLL_INTERVAL)
+                        response = SESSION.get(
+                            f"{BACKEND_URL}/ingest-status/{ingest['session_id']}", headers=headers,
+                            timeout=REQUEST_TIMEOUT
                         )
-                        if response.status_code == 200:
-                            st.session_state.session_id = response.json().get("session_id")
-                            st.session_state.file_name = uploaded_file.name
-                            st.session_state.messages = [{
-                                "role": "assistant",
-                                "content": f"I've analyzed **'{st.session_state.file_name}'**. What would you like to know?"
-                            }]
-                            st.success("Analysis complete!")
-                            st.rerun()
-                        else:
-                            st.error(f"Error: {response.text}")
-                    except Exception as e:
-                        st.error(f"Connection Error: {e}")
-            else:
-                st.warning("Please upload a PDF file first.")
+                        check_auth(response)
+                        ingest = response.json() if response.ok else {}
+                    if response.ok and ingest.get("status") in ("success", "ready"):
+                        st.session_state.session_id = ingest.get("session_id")
+                        st.session_state.file_name = uploaded_file.name
+                        st.session_state.messages = deque([{
+                            "role": "assistant",
+                            "content": f"I've analyzed **'{st.session_state.file_name}'**. What would you like to know?"
+                        }], maxlen=MAX_MESSAGES)
+                        st.success("Analysis complete!")
+                        st.rerun()
+                    else:
+                        st.error(f"Error: {ingest.get('detail') or response.text}")
+                except Exception as e:
+                    st.error(f"Connection Error: {e}")
+        else:
+            st.warning("Please upload a PDF file first.")
 
-        st.markdown("---")
-        if st.button("Logout"):
-            for key in defaults:
-                st.session_state[key] = defaults[key]
-            st.rerun()
+    st.markdown("---")
+    if st.button("Logout"):
+        logout()
+
+def show_main_app():
+    with st.sidebar:
+        show_sidebar()
 
     st.header(f"Chat with VeriDoc about: `{st.session_state.file_name or 'Your Document'}`")
 
@@ -128,17 +188,25 @@ def show_main_app():
                 with st.spinner("Thinking..."):
                     try:
                         headers = {"Authorization": f"Bearer {st.session_state.token}"}
-                        response = requests.post(
+                        with SESSION.post(
                             f"{BACKEND_URL}/ask-question/",
                             json={"session_id": st.session_state.session_id, "query": prompt},
-                            headers=headers
-                        )
-                        if response.status_code == 200:
-                            answer = response.json().get("answer", "No answer found.")
-                            st.markdown(answer)
-                            st.session_state.messages.append({"role": "assistant", "content": answer})
-                        else:
-                            st.error(f"API Error: {response.text}")
+                            headers=headers,
+                            stream=True,
+                            timeout=REQUEST_TIMEOUT
+                        ) as response:
+                            check_auth(response)
+                            if response.status_code == 200:
+                                placeholder = st.empty()
+                                answer = ""
+                                for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                                    answer += chunk
+                                    placeholder.markdown(answer)
+                                answer = answer or "No answer found."
+                                placeholder.markdown(answer)
+                                st.session_state.messages.append({"role": "assistant", "content": answer})
+                            else:
+                                st.error(f"API Error: {response.text}")
                     except Exception as e:
                         st.error(f"Connection Error: {e}")
     else:
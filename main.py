@@ -1,28 +1,43 @@
 import os
-import tempfile
+import sys
+
+# uvicorn imports "main:app" by name; alias the running script (or spawned worker)
+# so the module-level clients below are built once per process, not twice
+if __name__ in ("__main__", "__mp_main__"):
+    sys.modules.setdefault("main", sys.modules[__name__])
+
+import asyncio
 import hashlib
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends, status
+import uuid
+import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import httpx
+import aiofiles
+from cachetools import TTLCache
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends, BackgroundTasks, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from dotenv import load_dotenv
 import uvicorn
 import firebase_admin
 from firebase_admin import credentials, firestore
 from passlib.context import CryptContext
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from typing import Optional
 import jwt
 from datetime import datetime, timedelta, timezone
-from sentence_transformers import SentenceTransformer
-from langchain.embeddings import HuggingFaceEmbeddings
-
-embeddings_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
 
 # --- LangChain & Pinecone Imports ---
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+import pypdfium2 as pdfium
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_pinecone import PineconeVectorStore
-from langchain.chains import RetrievalQA
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
 from pinecone import Pinecone
 
 # --- INITIALIZATION ---
@@ -30,33 +45,117 @@ load_dotenv()
 
 # --- Firebase Initialization ---
 cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH", "firebase-credentials.json"))
-firebase_admin.initialize_app(cred)
+# stays safe if this module is ever imported a second time under another name
+if not firebase_admin._apps:
+    firebase_admin.initialize_app(cred)
 db = firestore.client()
 
 # --- Security & Auth Configuration ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2 for new hashes; existing bcrypt hashes still verify and are upgraded on login
+pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 SECRET_KEY = os.getenv("SECRET_KEY", "a_super_secret_key_for_dev_that_should_be_in_env")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Uploads live here until ingestion finishes; defaults to the system temp dir
+UPLOAD_TMPDIR = os.getenv("UPLOAD_TMPDIR")
+if UPLOAD_TMPDIR:
+    os.makedirs(UPLOAD_TMPDIR, exist_ok=True)
+EMBED_BATCH_SIZE = 256
+UPSERT_BATCH_SIZE = 100
+EMBED_CONCURRENCY = 4
+QUESTION_TASK_TTL_SECONDS = 600
+RETRIEVAL_K = 3
+# an ingestion still "processing" after this long is assumed lost (e.g. worker restart)
+INGEST_STALE_AFTER = timedelta(minutes=15)
 
 # --- Pydantic Models ---
 class UserCreate(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
     email: EmailStr
     password: str
 
 class UserInDB(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
     email: EmailStr
     hashed_password: str
 
 class Token(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
     access_token: str
     token_type: str
 
+# --- Semantic Answer Cache ---
+# Answers are cached per session_id and matched on query embedding, so repeated or
+# paraphrased questions skip retrieval and the LLM. OpenAI embeddings are unit
+# length, so cosine similarity is a plain dot product.
+class SemanticAnswerCache:
+    def __init__(self, threshold: float, ttl_seconds: float, max_entries: int, max_sessions: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()  # session_id -> [(expires_at, embedding, answer)]
+        self._lock = threading.RLock()
+
+    def _live_entries(self, session_id: str):
+        entries = self._sessions.get(session_id, [])
+        now = time.monotonic()
+        live = [entry for entry in entries if entry[0] > now]
+        self.evictions += len(entries) - len(live)
+        if live:
+            self._sessions[session_id] = live
+        else:
+            self._sessions.pop(session_id, None)
+        return live
+
+    def lookup(self, session_id: str, embedding) -> Optional[str]:
+        query = np.asarray(embedding)
+        with self._lock:
+            best_score, best_answer = -1.0, None
+            for _, stored, answer in self._live_entries(session_id):
+                score = float(np.dot(stored, query))
+                if score > best_score:
+                    best_score, best_answer = score, answer
+            if best_answer is not None and best_score >= self.threshold:
+                self.hits += 1
+                self._sessions.move_to_end(session_id)
+                return best_answer
+            self.misses += 1
+            return None
+
+    def store(self, session_id: str, embedding, answer: str):
+        with self._lock:
+            entries = self._live_entries(session_id)
+            entries.append((time.monotonic() + self.ttl_seconds, np.asarray(embedding), answer))
+            if len(entries) > self.max_entries:
+                del entries[0]
+                self.evictions += 1
+            self._sessions[session_id] = entries
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                _, dropped = self._sessions.popitem(last=False)
+                self.evictions += len(dropped)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": sum(len(entries) for entries in self._sessions.values())
+            }
+
 # --- CONFIGURATION ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+# text-embedding-3 vectors can be shortened; the Pinecone index must use the same dimension
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "512"))
 
 if not all([OPENAI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
     raise ValueError("⚠️  Missing one or more environment variables.")
@@ -65,59 +164,287 @@ if not all([OPENAI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
 if PINECONE_API_KEY:
     os.environ['PINECONE_API_KEY'] = PINECONE_API_KEY
 
-embeddings_model = OpenAIEmbeddings(model="text-embedding-3-small")
-llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+# One HTTP/2 connection pool to the OpenAI API, shared by embeddings and chat
+openai_http_limits = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+openai_http_client = httpx.Client(http2=True, limits=openai_http_limits, timeout=httpx.Timeout(60.0))
+openai_async_http_client = httpx.AsyncClient(http2=True, limits=openai_http_limits, timeout=httpx.Timeout(60.0))
+
+embeddings_model = OpenAIEmbeddings(
+    model="text-embedding-3-small",
+    dimensions=EMBEDDING_DIMENSIONS,
+    chunk_size=512,
+    max_retries=3,
+    request_timeout=30,
+    http_client=openai_http_client,
+    http_async_client=openai_async_http_client
+)
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=150, length_function=len)
+llm = ChatOpenAI(
+    model='gpt-4o-mini',
+    temperature=0.0,
+    streaming=True,
+    http_client=openai_http_client,
+    http_async_client=openai_async_http_client
+)
 pc = Pinecone(api_key=PINECONE_API_KEY)
+PINECONE_INDEX = pc.Index(str(PINECONE_INDEX_NAME))
+
+qa_prompt = ChatPromptTemplate.from_messages([
+    ("system", "Use the following pieces of context to answer the user's question. "
+               "If you don't know the answer, just say that you don't know, don't try to make up an answer.\n\n{context}"),
+    ("user", "{question}")
+])
+answer_chain = qa_prompt | llm | StrOutputParser()
+
+# session_ids whose namespace is known to hold vectors in this process
+indexed_sessions = set()
+pdfium_lock = threading.Lock()
+# background /ask-question/async tasks by task_id, dropped once polled or expired
+question_tasks = {}
+# per-session vectorstores, expired so idle namespaces do not pin objects forever
+vectorstores = TTLCache(maxsize=512, ttl=3600)
+vectorstores_lock = threading.RLock()
+# email -> Firestore user record, so repeat logins skip the round-trip
+user_cache = TTLCache(maxsize=10000, ttl=60)
+user_cache_lock = threading.RLock()
+user_cache_stats = {"hits": 0, "misses": 0}
+# bearer token -> (email, exp), so repeat requests skip re-verifying the JWT
+token_cache = TTLCache(maxsize=10000, ttl=60)
+token_cache_lock = threading.RLock()
+answer_cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=300, max_entries=64, max_sessions=1024)
 
 app = FastAPI(title="VeriDoc AI Analyst API", version="2.0.0 (SaaS Ready)")
+logger = logging.getLogger("uvicorn.error")
 
 # --- Helper Functions ---
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def verify_and_update_password(plain_password, hashed_password):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def get_user_record(email: str) -> Optional[dict]:
+    with user_cache_lock:
+        user_data = user_cache.get(email)
+        user_cache_stats["hits" if user_data is not None else "misses"] += 1
+    if user_data is not None:
+        return user_data
+    user_doc = db.collection('users').document(email).get()
+    user_data = user_doc.to_dict() if user_doc.exists else None
+    if user_data:
+        with user_cache_lock:
+            user_cache[email] = user_data
+    return user_data
+
+def invalidate_user_record(email: str):
+    with user_cache_lock:
+        user_cache.pop(email, None)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + (expires_delta if expires_delta else timedelta(minutes=15))
-    to_encode.update({"exp": expire})
+    expires_in = expires_delta.total_seconds() if expires_delta else 15 * 60
+    to_encode["exp"] = int(time.time() + expires_in)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def load_pdf_documents(file_path: str, source: str):
+    docs = []
+    # PDFium is not thread-safe, so extraction from to_thread workers is serialized
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            for i, page in enumerate(pdf):
+                textpage = page.get_textpage()
+                docs.append(Document(page_content=textpage.get_text_range(), metadata={"source": source, "page": i}))
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+    return docs
+
+def set_ingestion_status(session_id: str, ingest_status: str, detail: Optional[str] = None):
+    db.collection('ingestions').document(session_id).set({
+        "status": ingest_status,
+        "detail": detail,
+        "index_name": PINECONE_INDEX_NAME,
+        "dimension": EMBEDDING_DIMENSIONS,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    })
+
+def get_ingestion(session_id: str) -> Optional[dict]:
+    ingest_doc = db.collection('ingestions').document(session_id).get()
+    if not ingest_doc.exists:
+        return None
+    ingestion = ingest_doc.to_dict() or {}
+    # a marker written for another (or a since recreated) index says nothing about this one
+    if ingestion.get("index_name") != PINECONE_INDEX_NAME or ingestion.get("dimension") != EMBEDDING_DIMENSIONS:
+        return None
+    return ingestion
+
+def ingestion_in_progress(ingestion: Optional[dict]) -> bool:
+    if not ingestion:
+        return False
+    updated_at = ingestion.get("updated_at")
+    return (
+        ingestion.get("status") == "processing"
+        and updated_at is not None
+        and datetime.now(timezone.utc) - updated_at < INGEST_STALE_AFTER
+    )
+
+def namespace_has_vectors(session_id: str, ingestion: Optional[dict] = None) -> bool:
+    if session_id in indexed_sessions:
+        return True
+    # the Firestore marker is shared by all workers; while it says processing or failed the
+    # namespace may only hold part of the document, so Pinecone stats are not consulted
+    if ingestion is not None:
+        if ingestion.get("status") == "ready":
+            indexed_sessions.add(session_id)
+            return True
+        return False
+    stats = PINECONE_INDEX.describe_index_stats()
+    namespace = stats.namespaces.get(session_id)
+    if namespace and namespace.vector_count > 0:
+        indexed_sessions.add(session_id)
+        return True
+    return False
+
+async def index_documents(split_docs, session_id: str):
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+    # Batch similar-length chunks together; ids keep each chunk's original position
+    numbered_docs = sorted(enumerate(split_docs), key=lambda item: len(item[1].page_content))
+
+    async def embed_and_upsert(batch):
+        async with semaphore:
+            texts = [doc.page_content for _, doc in batch]
+            vectors = await asyncio.to_thread(embeddings_model.embed_documents, texts)
+            records = [
+                (f"{session_id}-{position}", vector, {**doc.metadata, "text": doc.page_content})
+                for (position, doc), vector in zip(batch, vectors)
+            ]
+            await asyncio.to_thread(
+                PINECONE_INDEX.upsert,
+                vectors=records,
+                namespace=session_id,
+                batch_size=UPSERT_BATCH_SIZE,
+                show_progress=False
+            )
+
+    await asyncio.gather(*(
+        embed_and_upsert(numbered_docs[start:start + EMBED_BATCH_SIZE])
+        for start in range(0, len(numbered_docs), EMBED_BATCH_SIZE)
+    ))
+
+async def ingest_document(file_path: str, source: str, session_id: str):
+    try:
+        docs = await asyncio.to_thread(load_pdf_documents, file_path, source)
+        split_docs = await asyncio.to_thread(text_splitter.split_documents, docs)
+        await index_documents(split_docs, session_id)
+        indexed_sessions.add(session_id)
+        await asyncio.to_thread(set_ingestion_status, session_id, "ready")
+    except Exception as e:
+        logger.exception(f"Ingestion failed for {session_id}")
+        await asyncio.to_thread(set_ingestion_status, session_id, "failed", str(e))
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def get_vectorstore(session_id: str):
+    with vectorstores_lock:
+        vectorstore = vectorstores.get(session_id)
+        if vectorstore is None:
+            vectorstore = PineconeVectorStore(
+                index=PINECONE_INDEX,
+                embedding=embeddings_model,
+                namespace=session_id,
+                text_key="text"
+            )
+            vectorstores[session_id] = vectorstore
+        return vectorstore
+
+async def retrieve_context(session_id: str, query_embedding) -> str:
+    # The sync search reuses the pooled PINECONE_INDEX; the async one opens and closes a client per call.
+    docs = await asyncio.to_thread(
+        get_vectorstore(session_id).similarity_search_by_vector, query_embedding, k=RETRIEVAL_K
+    )
+    return "\n\n".join(doc.page_content for doc in docs)
+
+async def answer_question(session_id: str, query: str) -> str:
+    query_embedding = await embeddings_model.aembed_query(query)
+    answer = answer_cache.lookup(session_id, query_embedding)
+    if answer is None:
+        context = await retrieve_context(session_id, query_embedding)
+        answer = await answer_chain.ainvoke({"context": context, "question": query})
+        # nothing retrieved (unknown or still-filling namespace): don't pin the "don't know" answer
+        if context:
+            answer_cache.store(session_id, query_embedding, answer)
+    return answer
+
 def get_current_user(token: str = Depends(oauth2_scheme)):
+    with token_cache_lock:
+        cached = token_cache.get(token)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_email: str = payload.get("sub")
         if user_email is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
+        with token_cache_lock:
+            token_cache[token] = (user_email, payload.get("exp", 0))
         return user_email
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
 
+# --- STARTUP ---
+@app.on_event("startup")
+async def warm_up_clients():
+    # Pay for TLS handshakes, tokenizer loads and index metadata before the first user request
+    *client_results, stats = await asyncio.gather(
+        asyncio.to_thread(embeddings_model.embed_query, "warmup"),
+        embeddings_model.aembed_query("warmup"),
+        llm.bind(max_tokens=1).ainvoke("hi"),
+        asyncio.to_thread(PINECONE_INDEX.describe_index_stats),
+        return_exceptions=True
+    )
+    for result in (*client_results, stats):
+        if isinstance(result, Exception):
+            logger.warning(f"Client warm-up failed: {result}")
+    # every upsert and query would fail against a mismatched index, so refuse to start
+    if not isinstance(stats, Exception) and stats.dimension != EMBEDDING_DIMENSIONS:
+        raise RuntimeError(
+            f"Pinecone index '{PINECONE_INDEX_NAME}' has dimension {stats.dimension} but "
+            f"EMBEDDING_DIMENSIONS={EMBEDDING_DIMENSIONS}; recreate the index or set EMBEDDING_DIMENSIONS={stats.dimension}"
+        )
+
 # --- AUTHENTICATION ---
 @app.post("/auth/signup", response_model=Token)
 async def signup(user: UserCreate):
     users_ref = db.collection('users')
-    user_doc = users_ref.document(user.email).get()
-    if user_doc.exists:
+    if await asyncio.to_thread(get_user_record, user.email) is not None:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
     new_user_data = {"email": user.email, "hashed_password": hashed_password}
-    users_ref.document(user.email).set(new_user_data)
+    await asyncio.to_thread(users_ref.document(user.email).set, new_user_data)
+    invalidate_user_record(user.email)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/auth/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    users_ref = db.collection('users')
-    user_doc = users_ref.document(form_data.username).get()
-    if not user_doc.exists:
+    user_data = await asyncio.to_thread(get_user_record, form_data.username)
+    if not user_data:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    user_data = user_doc.to_dict()
-    if not user_data or not verify_password(form_data.password, user_data.get("hashed_password")):
+    verified, new_hash = await asyncio.to_thread(
+        verify_and_update_password, form_data.password, user_data.get("hashed_password")
+    )
+    if not verified:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    if new_hash:
+        await asyncio.to_thread(
+            db.collection('users').document(form_data.username).update, {"hashed_password": new_hash}
+        )
+        invalidate_user_record(form_data.username)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": form_data.username}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
@@ -127,62 +454,124 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 def read_root():
     return {"status": "ok", "message": "VeriDoc API is alive!"}
 
+@app.get("/metrics")
+def read_metrics():
+    with user_cache_lock:
+        user_cache_metrics = {**user_cache_stats, "entries": len(user_cache)}
+    return {"answer_cache": answer_cache.stats(), "user_cache": user_cache_metrics}
+
 # --- PDF Upload & Embedding ---
 @app.post("/upload-whitepaper/")
 async def upload_whitepaper(
+    response: Response,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    token: str = Depends(oauth2_scheme)
+    user_email: str = Depends(get_current_user)
 ):
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Invalid file type.")
     tmp_file_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
+        sha256 = hashlib.sha256()
+        async with aiofiles.tempfile.NamedTemporaryFile("wb", delete=False, suffix=".pdf", dir=UPLOAD_TMPDIR) as tmp_file:
             tmp_file_path = tmp_file.name
-        file_hash = hashlib.sha256(content).hexdigest()
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+                await tmp_file.write(chunk)
+        file_hash = sha256.hexdigest()
         session_id = f"doc_{file_hash}"
-        loader = PyPDFLoader(tmp_file_path)
-        docs = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        split_docs = text_splitter.split_documents(docs)
-        PineconeVectorStore.from_documents(
-            documents=split_docs,
-            embedding=embeddings_model,
-            index_name=str(PINECONE_INDEX_NAME),
-            namespace=session_id
-        )
-        return {"status": "success", "session_id": session_id}
+        ingestion = None if session_id in indexed_sessions else await asyncio.to_thread(get_ingestion, session_id)
+        if await asyncio.to_thread(namespace_has_vectors, session_id, ingestion):
+            return {"status": "success", "session_id": session_id, "cached": True}
+        response.status_code = status.HTTP_202_ACCEPTED
+        if not ingestion_in_progress(ingestion):
+            await asyncio.to_thread(set_ingestion_status, session_id, "processing")
+            background_tasks.add_task(ingest_document, tmp_file_path, str(file.filename), session_id)
+            tmp_file_path = None  # the background task removes it when done
+        return {"status": "processing", "session_id": session_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         if tmp_file_path and os.path.exists(tmp_file_path):
             os.remove(tmp_file_path)
 
+@app.get("/ingest-status/{session_id}")
+async def ingest_status(session_id: str, user_email: str = Depends(get_current_user)):
+    if session_id in indexed_sessions:
+        return {"status": "ready", "session_id": session_id}
+    ingestion = await asyncio.to_thread(get_ingestion, session_id)
+    if ingestion is None:
+        raise HTTPException(status_code=404, detail="Unknown session_id")
+    return {"status": ingestion.get("status"), "session_id": session_id, "detail": ingestion.get("detail")}
+
 # --- Question Answering Endpoint ---
 @app.post("/ask-question/")
 async def ask_question(
     session_id: str = Body(...),
     query: str = Body(...),
-    token: str = Depends(oauth2_scheme)
+    user_email: str = Depends(get_current_user)
 ):
     try:
-        vectorstore = PineconeVectorStore.from_existing_index(
-            index_name=str(PINECONE_INDEX_NAME),
-            embedding=embeddings_model,
-            namespace=session_id
-        )
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever()
-        )
-        result = qa_chain.invoke(query)
-        return {"status": "success", "answer": result.get('result', 'No answer found.')}
+        query_embedding = await embeddings_model.aembed_query(query)
+        cached_answer = answer_cache.lookup(session_id, query_embedding)
+        if cached_answer is None:
+            context = await retrieve_context(session_id, query_embedding)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def answer_stream():
+        if cached_answer is not None:
+            yield cached_answer
+            return
+        chunks = []
+        async for chunk in answer_chain.astream({"context": context, "question": query}):
+            chunks.append(chunk)
+            yield chunk
+        if context:
+            answer_cache.store(session_id, query_embedding, "".join(chunks))
+
+    return StreamingResponse(answer_stream(), media_type="text/plain")
+
+# --- Background Question Tasks ---
+@app.post("/ask-question/async", status_code=status.HTTP_202_ACCEPTED)
+async def ask_question_async(
+    session_id: str = Body(...),
+    query: str = Body(...),
+    user_email: str = Depends(get_current_user)
+):
+    task_id = uuid.uuid4().hex
+    task = asyncio.create_task(answer_question(session_id, query))
+    task.add_done_callback(
+        lambda _: asyncio.get_running_loop().call_later(QUESTION_TASK_TTL_SECONDS, question_tasks.pop, task_id, None)
+    )
+    question_tasks[task_id] = task
+    return {"status": "pending", "task_id": task_id}
+
+@app.get("/task/{task_id}")
+async def get_question_task(task_id: str, user_email: str = Depends(get_current_user)):
+    task = question_tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not task.done():
+        return {"status": "pending", "task_id": task_id}
+    question_tasks.pop(task_id, None)
+    if task.cancelled():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Task was cancelled")
+    if task.exception() is not None:
+        raise HTTPException(status_code=500, detail=str(task.exception()))
+    return {"status": "done", "task_id": task_id, "answer": task.result()}
+
 # --- MAIN ENTRYPOINT ---
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # In-memory caches and /task/ polling state are per worker; raise WEB_CONCURRENCY
+    # only behind sticky routing or when clients don't use /ask-question/async.
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        # workers need an import string; a single worker reuses the app already built here
+        "main:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
+    )